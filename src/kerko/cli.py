@@ -1,5 +1,6 @@
+import json
 import pprint
-from datetime import datetime
+import time
 from typing import Any
 
 import click
@@ -16,12 +17,17 @@ from kerko.sync.attachments import delete_attachments, sync_attachments
 from kerko.sync.cache import sync_cache
 from kerko.sync.index import sync_index
 
+# Command targets that each kind of data belongs to.
+_CACHE_TARGETS = frozenset({'everything', 'cache'})
+_INDEX_TARGETS = frozenset({'everything', 'index'})
+_ATTACHMENTS_TARGETS = frozenset({'everything', 'attachments'})
+
 
 @wrapt.decorator
 def execution_time_logger(wrapped, _instance, args, kwargs):
-    start_time = datetime.now()
+    start_time = time.perf_counter()
     return_value = wrapped(*args, **kwargs)
-    current_app.logger.info(_format_elapsed_time(start_time))
+    current_app.logger.info(_format_elapsed_time(time.perf_counter() - start_time))
     return return_value
 
 
@@ -54,11 +60,11 @@ def sync(target, full=False):
     By default, everything is synchronized.
     """
     try:
-        if target in ['everything', 'cache']:
+        if target in _CACHE_TARGETS:
             sync_cache(full)
-        if target in ['everything', 'index']:
+        if target in _INDEX_TARGETS:
             sync_index(full)
-        if target in ['everything', 'attachments']:
+        if target in _ATTACHMENTS_TARGETS:
             sync_attachments(full)
     except SearchIndexError as e:
         current_app.logger.error(e)
@@ -81,11 +87,11 @@ def clean(target):
     Use the argument to select which data to delete, either the cache, the
     search index, the attachments, or all of those (everything).
     """
-    if target in ['everything', 'cache']:
+    if target in _CACHE_TARGETS:
         delete_storage('cache')
-    if target in ['everything', 'index']:
+    if target in _INDEX_TARGETS:
         delete_storage('index')
-    if target in ['everything', 'attachments']:
+    if target in _ATTACHMENTS_TARGETS:
         delete_attachments()
 
 
@@ -149,23 +155,34 @@ def config(show_secrets=False):
 
         - Filter values that cannot be serialized as TOML.
         - Sort dicts by key.
+
+        Nested dicts and lists are walked with an explicit stack rather than
+        with recursion. Each copied container is inserted into its parent
+        right away (preserving order), and filled when popped from the stack.
         """
-        if isinstance(obj, dict):
-            new_dict = {}
-            for k, v in sorted(obj.items()):
-                new_v = copy_serializable(v)
-                if new_v is not None:
-                    new_dict[k] = new_v
-            return new_dict
-        elif isinstance(obj, list):
-            new_list = []
-            for v in obj:
-                new_v = copy_serializable(v)
-                if new_v is not None:
-                    new_list.append(new_v)
-            return new_list
-        elif is_toml_serializable(obj):
-            return obj
+        if not isinstance(obj, (dict, list)):
+            return obj if is_toml_serializable(obj) else None
+        new_obj = {} if isinstance(obj, dict) else []
+        stack = [(obj, new_obj)]
+        while stack:
+            source, target = stack.pop()
+            if isinstance(source, dict):
+                pairs = sorted(source.items())
+            else:
+                pairs = ((None, v) for v in source)
+            for k, v in pairs:
+                if isinstance(v, (dict, list)):
+                    new_v = {} if isinstance(v, dict) else []
+                    stack.append((v, new_v))
+                elif is_toml_serializable(v):
+                    new_v = v
+                else:
+                    continue
+                if isinstance(target, dict):
+                    target[k] = new_v
+                else:
+                    target.append(new_v)
+        return new_obj
 
     serializable_config = copy_serializable(current_app.config)
     if not show_secrets:
@@ -184,7 +201,7 @@ def zotero_item(item_key):
     modified or removed from the module at any time.
     """
     credentials = zotero.init_zotero()
-    click.echo(pprint.pformat(zotero.load_item(credentials, item_key)))
+    click.echo(_format_response(zotero.load_item(credentials, item_key)))
 
 
 @cli.command()
@@ -197,7 +214,7 @@ def zotero_item_types():
     modified or removed from the module at any time.
     """
     credentials = zotero.init_zotero()
-    click.echo(pprint.pformat(zotero.load_item_types(credentials)))
+    click.echo(_format_response(zotero.load_item_types(credentials)))
 
 
 @cli.command()
@@ -210,7 +227,7 @@ def zotero_item_fields():
     modified or removed from the module at any time.
     """
     credentials = zotero.init_zotero()
-    click.echo(pprint.pformat(zotero.load_item_fields(credentials)))
+    click.echo(_format_response(zotero.load_item_fields(credentials)))
 
 
 @cli.command()
@@ -224,7 +241,7 @@ def zotero_item_type_fields(item_type):
     modified or removed from the module at any time.
     """
     credentials = zotero.init_zotero()
-    click.echo(pprint.pformat(zotero.load_item_type_fields(credentials, item_type)))
+    click.echo(_format_response(zotero.load_item_type_fields(credentials, item_type)))
 
 
 @cli.command()
@@ -238,7 +255,7 @@ def zotero_item_type_creator_types(item_type):
     modified or removed from the module at any time.
     """
     credentials = zotero.init_zotero()
-    click.echo(pprint.pformat(zotero.load_item_type_creator_types(credentials, item_type)))
+    click.echo(_format_response(zotero.load_item_type_creator_types(credentials, item_type)))
 
 
 @cli.command()
@@ -252,12 +269,27 @@ def zotero_top_level_collections():
     """
     credentials = zotero.init_zotero()
     collections = zotero.Collections(credentials, top_level=True)
-    for c in collections:
-        click.echo(f"{c.get('key')} {c.get('data', {}).get('name', '')}")
+    if len(collections) > 0:
+        click.echo('\n'.join(
+            f"{c.get('key')} {c.get('data', {}).get('name', '')}" for c in collections
+        ))
+
+
+def _format_response(response):
+    """
+    Format a Zotero API response for display.
+
+    Responses are formatted as JSON, which is much faster than `pprint` with
+    large responses, falling back to `pprint` if the data cannot be serialized.
+    """
+    try:
+        return json.dumps(response, indent=2, sort_keys=True, ensure_ascii=False)
+    except (TypeError, ValueError):
+        return pprint.pformat(response)
 
 
-def _format_elapsed_time(start_time):
-    elapsed_time = int(round((datetime.now() - start_time).total_seconds()))
+def _format_elapsed_time(elapsed_seconds):
+    elapsed_time = int(round(elapsed_seconds))
     elapsed_min, elapsed_sec = elapsed_time // 60, elapsed_time % 60
     s = 'Execution time:'
     if elapsed_min > 0:
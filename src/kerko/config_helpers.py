@@ -150,6 +150,7 @@ class ZoteroModel(BaseModel):
 
     batch_size: int = Field(ge=20)
     max_attempts: int = Field(ge=1)
+    max_concurrent_requests: int = Field(ge=1)
     wait: int = Field(ge=120)
     csl_style: str
     locale: str = Field(regex=r'^[a-z]{2}-[A-Z]{2}$')
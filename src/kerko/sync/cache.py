@@ -1,9 +1,14 @@
 """Synchronize the Zotero library into a local cache."""
 
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 from flask import current_app
 from whoosh.fields import (ID, NUMERIC, STORED, FieldConfigurationError,
                            Schema, UnknownFieldError)
-from whoosh.qparser import QueryParser
+from whoosh.query import Or, Term
+from whoosh.writing import CLEAR
 
 from kerko.shortcuts import composer, config
 from kerko.storage import SchemaError, load_object, open_index, save_object
@@ -11,14 +16,16 @@ from kerko.sync import zotero
 
 
 def get_formats():
-    return {
+    """Return the set of Zotero formats required by the composer's specs."""
+    composer_ = composer()
+    return frozenset(
         spec.extractor.format
-        for spec in list(composer().fields.values()) + list(composer().facets.values())
+        for spec in [*composer_.fields.values(), *composer_.facets.values()]
         if spec.extractor.format != 'data'
-    }
+    )
 
 
-def get_cache_schema():
+def get_cache_schema(formats):
     # CAUTION: When changing this schema, consider adapting any code that depend
     # on the changes to raise `SchemaError` if the the schema is incorrect.
     schema = Schema(
@@ -32,11 +39,35 @@ def get_cache_schema():
         data=STORED,  # Copied from Zotero.
         fulltext=STORED,  # Kerko addition.
     )
-    for format_ in get_formats():
+    for format_ in formats:
         schema.add(format_, STORED)
     return schema
 
 
+# Maximum number of items to remove from the cache with a single query.
+DELETE_BATCH_SIZE = 1000
+
+_worker = threading.local()
+
+
+def _init_worker(app):
+    """
+    Initialize a worker thread used for retrieving text content.
+
+    Each worker gets its own Zotero instance, reused for all of its requests,
+    since pyzotero keeps the state of the last request in the instance and
+    cannot be safely shared by threads.
+    """
+    with app.app_context():
+        _worker.zotero_credentials = zotero.init_zotero()
+
+
+def _load_item_fulltext(app, item_key):
+    """Retrieve the text content of an item from a worker thread."""
+    with app.app_context():
+        return zotero.load_item_fulltext(_worker.zotero_credentials, item_key)
+
+
 def sync_cache(full=False):
     """
     Build a cache of items retrieved from Zotero.
@@ -46,76 +77,142 @@ def sync_cache(full=False):
     current_app.logger.info("Starting cache sync...")
     count = 0
     zotero_credentials = zotero.init_zotero()
-    library_context = zotero.request_library_context(zotero_credentials)  # TODO: Load pickle & sync collections incrementally
     since = load_object('cache', 'version', default=0) if not full else 0
     version = zotero.last_modified_version(zotero_credentials)
+    if since and since == version:
+        # Any change to the library, including deletions, collections and text
+        # content, would have incremented its version.
+        current_app.logger.info(
+            f"The cache is already up-to-date with version {version}, nothing to do."
+        )
+        return 0
+    # When retrieving all items, the cache gets rebuilt from scratch.
+    rebuild = not since
+    # The deleted collections and items are both requested at once.
+    deleted = zotero.load_deleted(zotero_credentials, since) if not rebuild else {}
+    library_context = load_object('cache', 'library') if not rebuild else None
+    if library_context:
+        zotero.update_library_context(
+            zotero_credentials, library_context, since, deleted.get('collections', [])
+        )
+    else:
+        library_context = zotero.request_library_context(zotero_credentials)
+
+    formats = get_formats()
+    cache = open_index(
+        'cache', schema=lambda: get_cache_schema(formats), auto_create=True, write=True
+    )
+    # The writer is always single-process, regardless of the
+    # `whoosh_index_processors` parameter. A multiprocessing writer would fork
+    # while the worker threads that retrieve text content are running, which
+    # is unsafe. It would not gain much anyway, since cache fields are mostly
+    # stored, not indexed.
+    writer = cache.writer(limitmb=config('kerko.performance.whoosh_index_memory_limit'))
+    # On a rebuild, documents can be added without looking for existing ones
+    # to replace, since the previous content of the cache is discarded.
+    write = writer.add_document if rebuild else writer.update_document
 
-    cache = open_index('cache', schema=get_cache_schema, auto_create=True, write=True)
-    writer = cache.writer(
-        limitmb=config('kerko.performance.whoosh_index_memory_limit'),
-        procs=config('kerko.performance.whoosh_index_processors'),
+    # Text content is requested concurrently by worker threads, while the
+    # writer is only ever used from this thread. Documents are queued in
+    # `pending`, along with the future of their text content request (if any)
+    # and the arguments of their log message, and get written only from the
+    # head of the queue, thus in the order returned by Zotero.
+    max_requests = config('kerko.zotero.max_concurrent_requests')
+    app = current_app._get_current_object()  # pylint: disable=protected-access
+    executor = ThreadPoolExecutor(
+        max_workers=max_requests, initializer=_init_worker, initargs=(app,)
     )
+    pending = deque()
+
+    def write_document(document, future, log_args):
+        if future:
+            fulltext = future.result()
+            if fulltext:
+                document['fulltext'] = fulltext
+            elif 'fulltext' in document:
+                del document['fulltext']
+        write(**document)
+        current_app.logger.debug(*log_args)
+
+    def queue_document(document, *log_args, fulltext=False):
+        future = executor.submit(_load_item_fulltext, app, document['key']) if fulltext else None
+        pending.append((document, future, log_args))
+        # Bound the number of queued documents, hence of outstanding requests,
+        # by waiting on the head of the queue.
+        while len(pending) > 2 * max_requests:
+            write_document(*pending.popleft())
+        # Write whichever documents are ready at the head of the queue.
+        while pending and (pending[0][1] is None or pending[0][1].done()):
+            write_document(*pending.popleft())
+
     try:
+        if rebuild:
+            writer.mergetype = CLEAR
         if config('kerko.search.fulltext'):
             fulltext_items = zotero.load_new_fulltext(zotero_credentials, since)
         else:
             fulltext_items = {}
 
-        formats = get_formats()
-        for item in zotero.Items(zotero_credentials, since=since, formats=list(formats) + ['data']):
+        for item in zotero.Items(zotero_credentials, since=since, formats=[*formats, 'data']):
             count += 1
-
+            data = item.get('data', {})
             document = {
                 'key': item.get('key'),
                 'version': item.get('version'),
-                'parentItem': item.get('data', {}).get('parentItem', ''),
-                'itemType': item.get('data', {}).get('itemType', ''),
+                'parentItem': data.get('parentItem', ''),
+                'itemType': data.get('itemType', ''),
                 'library': item.get('library', {}),
                 'links': item.get('links', {}),
                 'meta': item.get('meta', {}),
-                'data': item.get('data', {}),
+                'data': data,
             }
             for format_ in formats:
                 if format_ in item:
                     document[format_] = item[format_]
+            # Logging arguments are formatted lazily, only if debug is enabled.
+            log_args = (
+                "Item %d updated (%s, version %s)", count, item.get('key'), item.get('version')
+            )
             if item.get('key') in fulltext_items:
                 del fulltext_items[item.get('key')]  # Mark this fulltext as updated.
-                fulltext = zotero.load_item_fulltext(zotero_credentials, item.get('key'))
-                if fulltext:
-                    document['fulltext'] = fulltext
-
-            writer.update_document(**document)
-            current_app.logger.debug(
-                f"Item {count} updated ({item.get('key')}, version {item.get('version')})"
-            )
+                queue_document(document, *log_args, fulltext=True)
+            else:
+                queue_document(document, *log_args)
 
         # Retrieve the updated fulltext of items that were otherwise unchanged.
-        for item_key in fulltext_items.keys():
+        # On a rebuild, any remaining fulltext belongs to items that are not in
+        # the library anymore (e.g., trashed items), hence is ignored.
+        if fulltext_items and not rebuild:
             with cache.searcher() as searcher:
-                results = searcher.search(
-                    QueryParser('key', schema=cache.schema, plugins=[]).parse(item_key),
-                    limit=1
-                )
-                if results:
-                    count += 1
-                    document = results[0].fields()
-                    fulltext = zotero.load_item_fulltext(zotero_credentials, item_key)
-                    if fulltext:
-                        document['fulltext'] = fulltext
-                    elif 'fulltext' in document:
-                        del document['fulltext']
-                    writer.update_document(**document)
-                    current_app.logger.debug(
-                        f"Item {count} text content updated "
-                        f"({item_key}, version {document['version']})"
-                    )
+                for item_key in fulltext_items.keys():
+                    document = searcher.document(key=item_key)
+                    if document:
+                        count += 1
+                        queue_document(
+                            document,
+                            "Item %d text content updated (%s, version %s)",
+                            count, item_key, document['version'],
+                            fulltext=True,
+                        )
+
+        # Write the documents that are still queued.
+        while pending:
+            write_document(*pending.popleft())
 
         # Check for items to remove.
         if since > 0:
-            for deleted in zotero.load_deleted_or_trashed_items(zotero_credentials, since):
-                count += 1
-                writer.delete_by_term('key', deleted)
-                current_app.logger.debug(f"Item {count} removed ({deleted})")
+            deleted_keys = [
+                *deleted.get('items', []),
+                *zotero.load_trashed_items(zotero_credentials, since),
+            ]
+            # Each deletion query requires a search of the cache, hence the
+            # batching of keys.
+            for start in range(0, len(deleted_keys), DELETE_BATCH_SIZE):
+                batch = deleted_keys[start:start + DELETE_BATCH_SIZE]
+                writer.delete_by_query(Or([Term('key', deleted) for deleted in batch]))
+                for deleted in batch:
+                    count += 1
+                    current_app.logger.debug("Item %d removed (%s)", count, deleted)
     except (FieldConfigurationError, UnknownFieldError) as e:
         writer.cancel()
         current_app.logger.error(e)
@@ -130,4 +227,9 @@ def sync_cache(full=False):
         current_app.logger.info(
             f"Cache sync successful, now at version {version} ({count} item(s) processed)."
         )
+    finally:
+        for _, future, _ in pending:
+            if future:
+                future.cancel()  # Abandon requests that have not started yet.
+        executor.shutdown()
     return count
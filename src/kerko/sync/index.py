@@ -1,8 +1,9 @@
 """Update the search index from the local cache."""
 
+import logging
+
 import whoosh
 from flask import current_app
-from whoosh.query import Term
 
 from kerko.shortcuts import composer, config
 from kerko.storage import (SchemaError, SearchIndexError, load_object,
@@ -23,49 +24,61 @@ def sync_index(full=False):
     cache_version = load_object('cache', 'version', default=0)
     if not cache_version:
         raise SearchIndexError("The cache is empty and needs to be synchronized first.")
-    # FIXME: The following does not detect when just the collections have changed in the cache (with no item changes). Should check the collections_version! https://pyzotero.readthedocs.io/en/latest/#zotero.Zotero.collection_versions
-    # if not full and load_object('index', 'version', default=0) == cache_version:
-    #     current_app.logger.warning(f"The index is already up-to-date with cache version {cache_version}, nothing to do.")
-    #     return 0
-
-    def yield_items(parent_key):
-        with cache.searcher() as searcher:
-            results = searcher.search(Term('parentItem', parent_key), limit=None)
-            for hit in results:
-                yield hit.fields()
-
-    def yield_top_level_items():
-        return yield_items('')
-
-    def yield_children(parent):
-        return yield_items(parent['key'])
 
     count = 0
+    extractions = [
+        spec.extract_to_document
+        for spec in [*composer().fields.values(), *composer().facets.values()]
+    ]
     index = open_index('index', schema=composer().schema, auto_create=True, write=True)
     writer = index.writer(
         limitmb=config('kerko.performance.whoosh_index_memory_limit'),
         procs=config('kerko.performance.whoosh_index_processors'),
     )
+    searcher = None
     try:
+        # Opened within the `try`, for the writer to get cancelled (hence the
+        # index to get unlocked) should this fail.
+        searcher = cache.searcher()
         writer.mergetype = whoosh.writing.CLEAR
         gate = TagGate(
             config('kerko.zotero.item_include_re'),
             config('kerko.zotero.item_exclude_re'),
         )
-        for item in yield_top_level_items():
+        # Map the key of each parent item to the document numbers of its
+        # children, using the postings of the parentItem field. This avoids
+        # searching the cache for each item. Top-level items are under the empty
+        # key. Stored fields get loaded only when each item is processed.
+        # Plain loops and bound methods are used rather than comprehensions,
+        # which would turn `reader` into a closure cell for the whole function.
+        reader = searcher.reader()
+        docnums = {}
+        for parent_key in reader.field_terms('parentItem'):
+            docnums[parent_key] = list(reader.postings('parentItem', parent_key).all_ids())
+        # Since the index gets cleared, documents can be added without looking
+        # for existing ones to replace.
+        add_document = writer.add_document
+        logger = current_app.logger
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        stored_fields = reader.stored_fields
+        for docnum in docnums.get('', []):
+            item = stored_fields(docnum)
             count += 1
-            if gate.check(item['data']):
-                item['children'] = list(yield_children(item))  # Extend the base Zotero item dict.
-                document = {}
-                for spec in list(composer().fields.values()) + list(composer().facets.values()):
-                    spec.extract_to_document(document, item, library_context)
-                writer.update_document(**document)
-                current_app.logger.debug(
-                    f"Item {count} updated ({item['key']}, {item.get('itemType')}): "
-                    f"{document.get('data', {}).get('title')}"
+            if not gate.check(item['data']):
+                if debug_enabled:
+                    logger.debug(f"Item {count} excluded ({item['key']})")
+                continue
+            # Extend the base Zotero item dict.
+            item['children'] = list(map(stored_fields, docnums.get(item['key'], [])))
+            document = {}
+            for extract_to_document in extractions:
+                extract_to_document(document, item, library_context)
+            add_document(**document)
+            if debug_enabled:
+                logger.debug(
+                    f"Item {count} updated ({item['key']}, {item['itemType']}): "
+                    f"{item['data'].get('title')}"
                 )
-            else:
-                current_app.logger.debug(f"Item {count} excluded ({item['key']})")
     except (whoosh.fields.FieldConfigurationError, whoosh.fields.UnknownFieldError) as e:
         writer.cancel()
         current_app.logger.error(e)
@@ -87,4 +100,7 @@ def sync_index(full=False):
             f"Index sync successful, now at version {cache_version} "
             f"({count} top level item(s) processed)."
         )
+    finally:
+        if searcher is not None:
+            searcher.close()
     return count
@@ -69,24 +69,50 @@ def init_zotero():
 
 
 def request_library_context(zotero_credentials):
-    item_types = {
-        t['itemType']: t['localized']
-        for t in load_item_types(zotero_credentials)
-    }
     return LibraryContext(
         zotero_credentials.library_id,
         zotero_credentials.library_type.rstrip('s'),  # Remove 's' appended by pyzotero.
         collections=Collections(zotero_credentials),
-        item_types=item_types,
-        item_fields={
+        **request_schema(zotero_credentials),
+    )
+
+
+def request_schema(zotero_credentials):
+    """Return the item types, fields and creator types, as `LibraryContext` arguments."""
+    item_types = {
+        t['itemType']: t['localized']
+        for t in load_item_types(zotero_credentials)
+    }
+    return {
+        'item_types': item_types,
+        'item_fields': {
             t: load_item_type_fields(zotero_credentials, t)
             for t in item_types.keys()
         },
-        creator_types={
+        'creator_types': {
             t: load_item_type_creator_types(zotero_credentials, t)
             for t in item_types.keys()
-        }
-    )
+        },
+    }
+
+
+def update_library_context(zotero_credentials, library_context, since, deleted_collections):
+    """
+    Update a library context with the changes made since the given version.
+
+    Only the collections modified since that version are requested, while the
+    keys of the deleted ones are provided by the caller. Item types, fields and
+    creator types are all requested again, to pick up any changes to the Zotero
+    schema.
+    """
+    schema = request_schema(zotero_credentials)
+    library_context.item_types = schema['item_types']
+    library_context.item_fields = schema['item_fields']
+    library_context.creator_types = schema['creator_types']
+    library_context.collections.update(Collections(zotero_credentials, since=since))
+    for key in deleted_collections:
+        library_context.collections.remove(key)
+    return library_context
 
 
 @retry_zotero
@@ -129,10 +155,14 @@ def load_item_type_creator_types(zotero_credentials, item_type):
 
 
 @retry_zotero
-def load_deleted_or_trashed_items(zotero_credentials, since):
-    deleted = zotero_credentials.deleted(since=since).get('items', [])
-    trashed = [trashed['key'] for trashed in Items(zotero_credentials, since=since, trash=True)]
-    return deleted + trashed
+def load_deleted(zotero_credentials, since):
+    """Return the keys of the objects deleted since the given version, by object type."""
+    return zotero_credentials.deleted(since=since)
+
+
+@retry_zotero
+def load_trashed_items(zotero_credentials, since):
+    return [trashed['key'] for trashed in Items(zotero_credentials, since=since, trash=True)]
 
 
 @retry_zotero
@@ -215,17 +245,29 @@ class Collections:
         }
     """
 
-    def __init__(self, zotero_credentials, top_level=False):
+    def __init__(self, zotero_credentials, top_level=False, since=0):
+        """
+        Construct the iterable.
+
+        :param zotero.Zotero zotero_credentials: The Zotero instance.
+
+        :param bool top_level: If `True`, retrieve only top-level collections.
+
+        :param int since: Retrieve only collections modified after this library
+            version.
+        """
         self.collections = {}
+        self._ancestors = {}  # Memoized results of `ancestors()`, by key.
         # Immediately load all collections, to allow later access by key.
-        self.load_collections(zotero_credentials, top_level)
+        self.load_collections(zotero_credentials, top_level, since)
         self.iterator = None
 
     @retry_zotero
-    def load_collections(self, zotero_credentials, top_level):
+    def load_collections(self, zotero_credentials, top_level, since):
         current_app.logger.info(
-            "Requesting {which} collections...".format(
-                which='top-level' if top_level else 'all'
+            "Requesting {which} collections{since}...".format(
+                which='top-level' if top_level else 'all',
+                since=f" modified since version {since}" if since else '',
             )
         )
         start = 0
@@ -233,14 +275,24 @@ class Collections:
             method = zotero_credentials.collections_top
         else:
             method = zotero_credentials.collections
+        params = {'since': since} if since else {}
         while True:
-            more = method(start=start, limit=config('kerko.zotero.batch_size'))
+            more = method(start=start, limit=config('kerko.zotero.batch_size'), **params)
             if not more:
                 break
             start += len(more)
             for collection in more:
                 self.collections[collection['key']] = collection
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_ancestors']  # Not worth pickling, rebuilt on demand.
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._ancestors = {}
+
     def __iter__(self):
         return self
 
@@ -261,6 +313,16 @@ class Collections:
     def get(self, key, default):
         return self.collections.get(key, default)
 
+    def update(self, other):
+        """Add or replace collections with those of another `Collections` instance."""
+        self.collections.update(other.collections)
+        self._ancestors.clear()
+
+    def remove(self, key):
+        """Remove a collection, if present."""
+        self.collections.pop(key, None)
+        self._ancestors.clear()
+
     def ancestors(self, key):
         """
         Return the ancestors of the specified collection.
@@ -269,15 +331,19 @@ class Collections:
             including the specified collection. Each list element is a
             collection key.
         """
-        collection = self.collections.get(key)
-        if collection:
-            parent_key = collection['data'].get('parentCollection')
-            if parent_key:
-                ancestors = self.ancestors(parent_key)
-                ancestors.append(key)
-                return ancestors
-            return [key]
-        return []
+        # Results are memoized since extractors look up the same collections
+        # for many items.
+        if key not in self._ancestors:
+            collection = self.collections.get(key)
+            if collection:
+                parent_key = collection['data'].get('parentCollection')
+                if parent_key:
+                    self._ancestors[key] = [*self.ancestors(parent_key), key]
+                else:
+                    self._ancestors[key] = [key]
+            else:
+                self._ancestors[key] = []
+        return list(self._ancestors[key])
 
 
 class Items:
@@ -52,19 +52,15 @@ class TagGate:
             a 'tag' key, whose corresponding value should be a string
             representing a tag.
         """
-        included = [True] if not self.include_re else [False] * len(self.include_re)
-        excluded = [False] if not self.exclude_re else [False] * len(self.exclude_re)
-        if self.include_re:
-            self._check_expressions(obj, self.include_re, included)
-        if self.exclude_re:
-            self._check_expressions(obj, self.exclude_re, excluded)
-        return all(included) and not all(excluded)
+        if not self.include_re and not self.exclude_re:
+            return True
+        # Strip the tags only once, rather than for each expression.
+        tags = [tag_data.get('tag', '').strip() for tag_data in obj.get('tags', [])]
+        if self.include_re and not self._match_all(self.include_re, tags):
+            return False
+        return not (self.exclude_re and self._match_all(self.exclude_re, tags))
 
     @staticmethod
-    def _check_expressions(obj, expressions, expr_results):
-        for i, expr in enumerate(expressions):
-            for tag_data in obj.get('tags', []):
-                tag = tag_data.get('tag', '').strip()
-                if expr.match(tag):
-                    expr_results[i] = True
-                    break
+    def _match_all(expressions, tags):
+        """Return whether every expression matches at least one of the tags."""
+        return all(any(expr.match(tag) for tag in tags) for expr in expressions)
@@ -2,14 +2,23 @@
 Integration tests for data synchronization.
 """
 
+import copy
+import json
+import re
+from unittest import mock
+
+import responses
 from flask import current_app
-from kerko.storage import SearchIndexError
+from kerko.config_helpers import config_set
+from kerko.storage import (SearchIndexError, get_doc_count, load_object,
+                           open_index)
 from kerko.sync import zotero
 from kerko.sync.cache import sync_cache
 from kerko.sync.index import sync_index
 
 from tests.integration_testing import (EmptyLibraryTestCase,
-                                       PopulatedLibraryTestCase)
+                                       PopulatedLibraryTestCase,
+                                       SynchronizedTestCase)
 
 
 class SyncPopulatedLibraryTestCase(PopulatedLibraryTestCase):
@@ -41,6 +50,188 @@ class SyncPopulatedLibraryTestCase(PopulatedLibraryTestCase):
         # TODO: Assert more things.
 
 
+class SyncFulltextLibraryTestCase(PopulatedLibraryTestCase):
+    """Test data synchronization with text content retrieved from Zotero."""
+
+    # Text content by item key. Empty content should not get stored.
+    FULLTEXT = {
+        '8UCNG48V': 'Text of 8UCNG48V',
+        'EPZFDKUE': '',
+        'MZPGBKMQ': 'Text of MZPGBKMQ',
+        'BWQDC77S': 'Text of BWQDC77S',
+        'X2IEN6S2': 'Text of X2IEN6S2',
+        'YE4WVE35': 'Text of YE4WVE35',
+    }
+
+    @classmethod
+    def init_config(cls):
+        super().init_config()
+        # Allow a single request at a time, to exercise the bound on pending
+        # requests with just a few items.
+        config_set(cls.app.config, 'kerko.zotero.max_concurrent_requests', 1)
+
+    @classmethod
+    def add_responses(cls):
+        super().add_responses()
+        cls.responses.replace(
+            responses.GET,
+            'https://api.zotero.org/groups/9999999/fulltext?since=0',
+            body=json.dumps({key: 26 for key in cls.FULLTEXT}),
+            content_type='application/json',
+            headers=cls.ZOTERO_RESPONSE_HEADERS,
+        )
+        for key, content in cls.FULLTEXT.items():
+            url = f'https://api.zotero.org/groups/9999999/items/{key}/fulltext'
+            cls.responses.add(
+                responses.GET,
+                re.compile(re.escape(url)),
+                body=json.dumps({'content': content, 'indexedPages': 1 if content else 0}),
+                content_type='application/json',
+                headers=cls.ZOTERO_RESPONSE_HEADERS,
+            )
+
+    def test_sync_cache(self):
+        self.assertEqual(sync_cache(full=True), 10)
+        with open_index('cache').searcher() as searcher:
+            documents = list(searcher.all_stored_fields())
+        # Documents are written in the order returned by Zotero, regardless of
+        # when their text content gets retrieved.
+        self.assertEqual(
+            [document['key'] for document in documents],
+            [item['key'] for item in json.loads(self.get_response('items'))],
+        )
+        for document in documents:
+            if self.FULLTEXT.get(document['key']):
+                self.assertEqual(document['fulltext'], self.FULLTEXT[document['key']])
+            else:
+                self.assertNotIn('fulltext', document)
+
+
+class SyncIncrementalLibraryTestCase(PopulatedLibraryTestCase):
+    """Test data synchronization of the changes made since the last sync."""
+
+    DELETED_ITEM_KEYS = ['UXA97IQG', 'EPZFDKUE', 'IR7VFLX4']
+    DELETED_COLLECTION_KEY = 'B4CRZ5ZV'
+    MODIFIED_COLLECTION_KEY = 'S7BFFL65'
+
+    @classmethod
+    def add_responses(cls):
+        collections = json.loads(cls.get_response('collections'))
+        deleted_collection = copy.deepcopy(collections[0])
+        deleted_collection['key'] = deleted_collection['data']['key'] = cls.DELETED_COLLECTION_KEY
+        deleted_collection['data']['name'] = 'test_deleted_collection'
+        modified_collection = copy.deepcopy(collections[0])
+        modified_collection['version'] = modified_collection['data']['version'] = 27
+        modified_collection['data']['name'] = 'test_modified_collection'
+
+        # Responses for the incremental sync, added before the fallbacks of the
+        # base class in order to take precedence over them.
+        cls.responses.add(
+            responses.GET,
+            'https://api.zotero.org/groups/9999999/collections?start=0&limit=100&since=26&format=json',
+            body=json.dumps([modified_collection]),
+            content_type='application/json',
+            headers=cls.ZOTERO_RESPONSE_HEADERS,
+        )
+        cls.responses.add(
+            responses.GET,
+            'https://api.zotero.org/groups/9999999/deleted?since=26&format=json&limit=100',
+            body=json.dumps({
+                'collections': [cls.DELETED_COLLECTION_KEY],
+                'items': cls.DELETED_ITEM_KEYS,
+            }),
+            content_type='application/json',
+            headers=cls.ZOTERO_RESPONSE_HEADERS,
+        )
+        cls.responses.add(
+            responses.GET,
+            'https://api.zotero.org/groups/9999999/fulltext?since=26',
+            body='{}',
+            content_type='application/json',
+            headers=cls.ZOTERO_RESPONSE_HEADERS,
+        )
+        for url in [
+            'https://api.zotero.org/groups/9999999/items?since=26&start=0&limit=100&sort=dateAdded&direction=asc&include=bib%2Cbibtex%2Ccoins%2Cdata%2Cris&style=apa&format=json',
+            'https://api.zotero.org/groups/9999999/items/trash?since=26&start=0&limit=100&sort=dateAdded&direction=asc&include=data&style=apa&format=json',
+        ]:
+            cls.responses.add(
+                responses.GET,
+                url,
+                body='[]',
+                content_type='application/json',
+                headers={**cls.ZOTERO_RESPONSE_HEADERS, 'Total-Results': '0'},
+            )
+        super().add_responses()
+        cls.responses.replace(
+            responses.GET,
+            'https://api.zotero.org/groups/9999999/collections?start=0&limit=100&format=json',
+            body=json.dumps([*collections, deleted_collection]),
+            content_type='application/json',
+            headers=cls.ZOTERO_RESPONSE_HEADERS,
+        )
+
+    def test_sync_cache(self):
+        self.assertEqual(sync_cache(), 10)
+        self.assertIn(self.DELETED_COLLECTION_KEY, load_object('cache', 'library').collections)
+
+        # Move the library to the next version.
+        self.responses.replace(
+            responses.GET,
+            'https://api.zotero.org/groups/9999999/items?limit=1&format=json',
+            body=self.get_response('items_versions'),
+            content_type='application/json',
+            headers={
+                **self.ZOTERO_RESPONSE_HEADERS,
+                'Total-Results': self.ZOTERO_ITEMS_TOTAL_RESULTS,
+                'Last-Modified-Version': '27',
+            },
+        )
+        # Add a field to a known item type, as a Zotero schema update would.
+        book_fields = [
+            *json.loads(self.get_response('itemTypeFields_book')),
+            {'field': 'testNewField', 'localized': 'Test New Field'},
+        ]
+        self.responses.add(
+            responses.GET,
+            re.compile(
+                re.escape('https://api.zotero.org/itemTypeFields?itemType=book&locale=en-US')
+                + r'(\&timeout=[0-9]+)?'
+            ),
+            body=json.dumps(book_fields),
+            content_type='application/json',
+            headers=self.ZOTERO_RESPONSE_HEADERS,
+        )
+        # Delete the items through more than one batch.
+        with mock.patch('kerko.sync.cache.DELETE_BATCH_SIZE', 2):
+            self.assertEqual(sync_cache(), len(self.DELETED_ITEM_KEYS))
+
+        self.assertEqual(load_object('cache', 'version'), 27)
+        self.assertEqual(
+            len([call for call in self.responses.calls if '/deleted?' in call.request.url]), 1
+        )
+        self.assertEqual(get_doc_count('cache'), 10 - len(self.DELETED_ITEM_KEYS))
+        with open_index('cache').searcher() as searcher:
+            for key in self.DELETED_ITEM_KEYS:
+                self.assertIsNone(searcher.document(key=key))
+
+        library_context = load_object('cache', 'library')
+        self.assertNotIn(self.DELETED_COLLECTION_KEY, library_context.collections)
+        self.assertEqual(
+            library_context.collections[self.MODIFIED_COLLECTION_KEY]['data']['name'],
+            'test_modified_collection',
+        )
+        self.assertEqual(set(library_context.item_fields.keys()), set(self.ZOTERO_ITEM_TYPES))
+        self.assertEqual(library_context.item_fields['book'], book_fields)
+
+
+class SyncUpToDateLibraryTestCase(SynchronizedTestCase):
+    """Test data synchronization when the cache is already up-to-date."""
+
+    def test_sync_cache(self):
+        self.assertEqual(sync_cache(), 0)
+        self.assertGreater(sync_cache(full=True), 0, "Cache is empty!")
+
+
 class SyncEmptyLibraryTestCase(EmptyLibraryTestCase):
     """
     Test data synchronization with an empty Zotero library.